@@ -22,7 +22,9 @@ INSTALL_REQUIRES = [
     "sentry-sdk[flask]",
     "bullmq",
     "pyjwt",
-    "redis",
+    "redis[hiredis]>=4.1",
+    "aiohttp",
+    "orjson",
     "bullmq==1.17.0",
     "python-dotenv==1.0.0"
 ]
@@ -42,16 +44,16 @@ setup(
     license=LICENSE,
     packages=PACKAGES,
     install_requires=INSTALL_REQUIRES,
+    python_requires='>=3.10',
     include_package_data=True,
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
-        'Programming Language :: Python :: 3.8',
-        'Programming Language :: Python :: 3.9',
         'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
+        'Programming Language :: Python :: 3.13',
     ],
 )
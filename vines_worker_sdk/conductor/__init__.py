@@ -1,28 +1,38 @@
 import asyncio
+import gzip
+import io
 import logging
 
+import aiohttp
 import requests
 import time
 import threading
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 from bullmq.types import QueueBaseOptions
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
 from vines_worker_sdk.exceptions import ServiceRegistrationException
-import json
+import orjson
 import redis
+from redis.utils import HIREDIS_AVAILABLE
 import os
+import queue
+import random
 from urllib.parse import urljoin
 from vines_worker_sdk.oss import OSSClient
 from .worker import Worker
 from bullmq import Queue
 
+logger = logging.getLogger(__name__)
+
+# 连续拉取为空的计数上限，退避时间早已达到 max_poll_interval_ms，继续累加只会导致指数运算溢出
+MAX_EMPTY_POLL_COUNT = 32
 
-class ConductorClient:
-    task_types = {}
 
-    # 当前正在运行的 task 列表
-    tasks = {}
+class ConductorClient:
 
     def __init__(
             self,
@@ -31,27 +41,104 @@ class ConductorClient:
             worker_id,
             redis_url: str,
             conductor_base_url: str,
-            poll_interval_ms=500,
+            poll_interval_ms=50,
             authentication_settings=None,
             task_output_payload_size_threshold_kb=1024,
             external_storage: OSSClient = None,
             external_storage_tmp_folder: str = "/tmp",
             worker_name_prefix=None,
             admin_server_url: str = None,
+            max_poll_interval_ms=2000,
+            poll_backoff_rate=1.5,
+            long_poll_timeout_ms=1000,
+            batch_poll_count=10,
+            max_workers=16,
+            workflow_root_cache_ttl_seconds=3600,
+            parent_walk_max_depth=32,
+            parent_walk_timeout_seconds=5.0,
+            parent_walk_total_timeout_seconds=15.0,
+            task_update_timeout_seconds=10.0,
+            task_update_max_retries=3,
+            shutdown_timeout_seconds=20.0,
     ):
         self.service_registration_url = service_registration_url
         self.service_registration_token = service_registration_token
         self.conductor_base_url = conductor_base_url
         self.worker_id = worker_id
         self.poll_interval_ms = poll_interval_ms
+        self.max_poll_interval_ms = max_poll_interval_ms
+        self.poll_backoff_rate = poll_backoff_rate
+        self.long_poll_timeout_ms = long_poll_timeout_ms
+        self.batch_poll_count = batch_poll_count
+        self.max_workers = max_workers
+        # 所有 task 共享同一个有界线程池执行
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # 已提交到线程池、尚未执行完成的 task
+        self.task_futures = {}
+        # 各轮询协程在拉取前预占的线程池空位数，避免多种 task 同时按同一个空位数拉取导致超量
+        self._reserved_slots = 0
+        # tasks 与 task_futures 会同时被轮询协程和线程池中的线程修改，所有读写都需要持有该锁。
+        # 轮询协程与信号处理函数都运行在主线程上，信号处理中调用 set_all_tasks_to_failed_state 时
+        # 主线程可能正持有该锁，因此必须是可重入锁，否则会死锁
+        self._tasks_lock = threading.RLock()
         self.authentication_settings = authentication_settings
         self.task_output_payload_size_threshold_kb = task_output_payload_size_threshold_kb
         self.external_storage = external_storage
         self.external_storage_tmp_folder = external_storage_tmp_folder
         self.worker_name_prefix = worker_name_prefix
         self.redis_url = redis_url
-        self.redis_client = redis.from_url(redis_url)
+        # 连接池大小与线程池匹配，池满时阻塞等待而不是直接报错；开启 TCP keepalive 与健康检查避免频繁重连
+        self.redis_client = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(
+            redis_url,
+            max_connections=max(64, max_workers * 2),
+            socket_keepalive=True,
+            health_check_interval=30
+        ))
         self.admin_server_url = admin_server_url
+        self.workflow_root_cache_ttl_seconds = workflow_root_cache_ttl_seconds
+        self.parent_walk_max_depth = parent_walk_max_depth
+        self.parent_walk_timeout_seconds = parent_walk_timeout_seconds
+        self.parent_walk_total_timeout_seconds = parent_walk_total_timeout_seconds
+        self.task_update_timeout_seconds = task_update_timeout_seconds
+        self.task_update_max_retries = task_update_max_retries
+        self.shutdown_timeout_seconds = shutdown_timeout_seconds
+        # set_all_tasks_to_failed_state 开始后设置，之后所有结果提交都不能超过该时间点
+        self._shutdown_deadline = None
+        self.task_types = {}
+        # 当前正在运行的 task 列表
+        self.tasks = {}
+        # 在 free-threading（无 GIL）的 Python 下，dict 的并发修改不再被隐式串行化，需要显式加锁
+        self._task_types_lock = threading.Lock()
+        # 所有同步 HTTP 请求复用同一个 session，以复用 TCP 连接
+        self._http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+        # 遍历 workflow 父链使用不重试的 session，由整体超时控制最坏耗时，避免 Retry 把每一层的耗时放大数倍
+        self._http_no_retry = requests.Session()
+        no_retry_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)
+        self._http_no_retry.mount("http://", no_retry_adapter)
+        self._http_no_retry.mount("https://", no_retry_adapter)
+        # URL 与鉴权信息在每次轮询、提交时都会用到，预先计算好
+        self._auth = self.__get_auth()
+        self._taskdefs_url = f"{conductor_base_url}/metadata/taskdefs"
+        self._tasks_url = f"{conductor_base_url}/tasks"
+        self._poll_url_tpl = f"{conductor_base_url}/tasks/poll/batch/{{}}"
+        self._workflow_url_tpl = f"{conductor_base_url}/workflow/{{}}"
+        # task 执行结果由后台线程异步提交给 conductor，不占用 worker 线程
+        # 队列有界：提交跟不上时阻塞 worker 线程，使线程池保持占满，从而让轮询停止拉取新任务
+        self._update_q = queue.Queue(maxsize=max_workers * 2)
+        # 多个提交线程并行提交，单个请求变慢或重试时不会阻塞其他结果
+        self._update_submitters = [
+            threading.Thread(target=self.__submit_task_results, daemon=True)
+            for _ in range(max_workers)
+        ]
+        for submitter in self._update_submitters:
+            submitter.start()
 
     def __get_auth(self):
         if not self.authentication_settings:
@@ -73,96 +160,143 @@ class ConductorClient:
             block['extra']['meta'] = {}
         block['extra']['meta']['source'] = self.worker_id
 
-    def __register_task_def(self, task_def):
+    def __register_task_defs(self, task_defs):
         """
-        向 conductor 注册 task
+        向 conductor 批量注册 task
         """
-        requests.post(
-            url=f"{self.conductor_base_url}/metadata/taskdefs",
-            json=[task_def]
+        self._http.post(
+            url=self._taskdefs_url,
+            json=task_defs
         )
 
     def register_worker(self, worker: Worker, retry_count=0, timeout_seconds=86400, owner_email='dev@infmonkeys.com'):
+        self.register_workers([worker], retry_count, timeout_seconds, owner_email)
 
+    def register_workers(self, workers: List[Worker], retry_count=0, timeout_seconds=86400,
+                         owner_email='dev@infmonkeys.com'):
+        """
+        批量注册 worker，所有 task 与 block 分别通过一次请求注册
+        """
         # 向 conductor 注册 worker
-        block_def = worker.block_def
-        task_def = {
-            "name": block_def.get('name'),
-            "inputKeys": [input.get('name') for input in block_def.get('input', [])],
-            "outputKeys": [output.get('name') for output in block_def.get('output', [])],
-            "retryCount": retry_count,
-            "timeoutSeconds": timeout_seconds,
-            "ownerEmail": owner_email
-        }
-        self.__register_task_def(task_def)
+        task_defs = []
+        block_defs = []
+        for worker in workers:
+            block_def = worker.block_def
+            task_defs.append({
+                "name": block_def.get('name'),
+                "inputKeys": [input.get('name') for input in block_def.get('input', [])],
+                "outputKeys": [output.get('name') for output in block_def.get('output', [])],
+                "retryCount": retry_count,
+                "timeoutSeconds": timeout_seconds,
+                "ownerEmail": owner_email
+            })
+            block_def['type'] = 'SIMPLE'
+            self.__add_source_for_block(block_def)
+            block_defs.append(block_def)
+        self.__register_task_defs(task_defs)
 
         # 向 vines 注册 block
-        block_def['type'] = 'SIMPLE'
-        self.__add_source_for_block(block_def)
         url = urljoin(self.service_registration_url, '/api/blocks/register')
-        r = requests.post(
+        r = self._http.post(
             url=url,
             json={
-                "blocks": [block_def]
+                "blocks": block_defs
             },
             headers={
                 "x-vines-service-registration-key": self.service_registration_token
             },
         )
-        json = r.json()
-        code, message = json.get('code'), json.get('message')
+        result = orjson.loads(r.content)
+        code, message = result.get('code'), result.get('message')
         if code != 200:
             raise ServiceRegistrationException(message)
-        data = json.get('data', {})
+        data = result.get('data', {})
         success = data.get('success')
         if not success:
             raise ServiceRegistrationException("Register blocks failed")
 
-        # TODO: 向 vines 注册 credential
-        if worker.credential_def:
-            pass
+        for worker in workers:
+            # TODO: 向 vines 注册 credential
+            if worker.credential_def:
+                pass
 
-        # 注册任务回调函数
-        self.__register_handler(worker.block_name, worker.handler)
+            # 注册任务回调函数
+            self.__register_handler(worker.block_name, worker.handler)
 
     def __register_handler(self, name, callback):
         name_with_prefix = self.worker_name_prefix + name if self.worker_name_prefix else name
-        self.task_types[name_with_prefix] = {
-            "callback": callback,
-            "block_name": name
-        }
+        with self._task_types_lock:
+            self.task_types[name_with_prefix] = {
+                "callback": callback,
+                "block_name": name
+            }
 
-    def __poll_by_task_type(self, task_type, worker_id, count=1, domain=None):
+    async def __poll_by_task_type(self, task_type, worker_id, count=1, domain=None):
         params = {
             "workerid": worker_id,
-            "count": count
+            "count": count,
+            # 长轮询：队列为空时由 conductor 挂起请求，直到有任务到达或超时
+            "timeout": self.long_poll_timeout_ms
         }
         if domain:
             params['domain'] = domain
 
-        r = requests.get(
-            url=f"{self.conductor_base_url}/tasks/poll/batch/{task_type}",
-            params=params,
-            auth=self.__get_auth()
-        )
-        tasks = r.json()
+        async with self._session.get(
+                url=self._poll_url_tpl.format(task_type),
+                params=params
+        ) as r:
+            # conductor 出错时返回的是 JSON 错误信息，需要先检查状态码，否则会被当作拉取到了任务
+            r.raise_for_status()
+            tasks = orjson.loads(await r.read())
         return tasks
 
     def __get_workflow_context_cache_key(self, workflow_instance_id: str):
         return f"workflow:context:{workflow_instance_id}"
 
+    def __get_workflow_root_cache_key(self, workflow_instance_id: str):
+        return f"workflow:root:{workflow_instance_id}"
+
     def __get_real_workflow_instance_id_start_by_server(self, workflow_instance_id):
-        has_parent_workflow = True
-        while has_parent_workflow:
-            r = requests.get(
-                url=f"{self.conductor_base_url}/workflow/{workflow_instance_id}",
-                auth=self.__get_auth()
+        # workflow 的父子关系不会变化，解析结果缓存在 redis 中，避免每次都沿父链逐级请求 conductor
+        cached = self.redis_client.get(self.__get_workflow_root_cache_key(workflow_instance_id))
+        if cached is not None:
+            return cached.decode('utf-8') if isinstance(cached, bytes) else cached
+
+        visited_workflow_instance_ids = [workflow_instance_id]
+        # 限制父链的遍历深度与单次请求耗时，避免 conductor 状态异常（如父链成环）或响应过慢时一直占用 worker 线程
+        deadline = time.monotonic() + self.parent_walk_total_timeout_seconds
+        for _ in range(self.parent_walk_max_depth):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Exception(
+                    f"workflow 父链遍历超过 {self.parent_walk_total_timeout_seconds} 秒：workflowInstanceId={visited_workflow_instance_ids[0]}")
+            r = self._http_no_retry.get(
+                url=self._workflow_url_tpl.format(workflow_instance_id),
+                auth=self._auth,
+                timeout=min(self.parent_walk_timeout_seconds, remaining)
             )
-            data = r.json()
-            if data.get('parentWorkflowId'):
-                workflow_instance_id = data.get('parentWorkflowId')
-            else:
-                has_parent_workflow = False
+            # 出错时响应中同样没有 parentWorkflowId，不检查状态码会把错误的结果写进缓存
+            r.raise_for_status()
+            data = orjson.loads(r.content)
+            parent_workflow_instance_id = data.get('parentWorkflowId')
+            if not parent_workflow_instance_id:
+                break
+            if parent_workflow_instance_id in visited_workflow_instance_ids:
+                raise Exception(f"workflow 父链存在循环引用：workflowInstanceId={parent_workflow_instance_id}")
+            workflow_instance_id = parent_workflow_instance_id
+            visited_workflow_instance_ids.append(workflow_instance_id)
+        else:
+            raise Exception(
+                f"workflow 父链深度超过 {self.parent_walk_max_depth}：workflowInstanceId={visited_workflow_instance_ids[0]}")
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for visited_workflow_instance_id in visited_workflow_instance_ids:
+            pipe.setex(
+                self.__get_workflow_root_cache_key(visited_workflow_instance_id),
+                self.workflow_root_cache_ttl_seconds,
+                workflow_instance_id
+            )
+        pipe.execute()
         return workflow_instance_id
 
     def __get_workflow_context(self, workflow_instance_id):
@@ -171,7 +305,31 @@ class ConductorClient:
         str_result = self.redis_client.get(key)
         if str_result is None:
             raise Exception(f"无法获取 workflow context for workflowInstanceId={workflow_instance_id}")
-        return json.loads(str_result)
+        return orjson.loads(str_result)
+
+    def __get_workflow_contexts(self, workflow_instance_ids):
+        """
+        批量获取 workflow context，只访问 redis：先一次 MGET 取回 root 缓存，再一次 MGET 取回 context。
+        root 未缓存或 context 不存在的 workflow 不在返回结果中，由各 task 在自己的线程中获取
+        """
+        unique_ids = list(set(workflow_instance_ids))
+        cached_root_ids = self.redis_client.mget([self.__get_workflow_root_cache_key(i) for i in unique_ids])
+        real_workflow_instance_ids = {
+            workflow_instance_id: cached.decode('utf-8') if isinstance(cached, bytes) else cached
+            for workflow_instance_id, cached in zip(unique_ids, cached_root_ids)
+            if cached is not None
+        }
+        if not real_workflow_instance_ids:
+            return {}
+        real_ids = list(set(real_workflow_instance_ids.values()))
+        values = self.redis_client.mget([self.__get_workflow_context_cache_key(i) for i in real_ids])
+        raw_contexts = dict(zip(real_ids, values))
+        # 返回原始字节，由每个 task 单独反序列化一份，避免同一 workflow 的多个 task 共享同一个可变 dict
+        return {
+            workflow_instance_id: raw_contexts[real_id]
+            for workflow_instance_id, real_id in real_workflow_instance_ids.items()
+            if raw_contexts[real_id] is not None
+        }
 
     def __get_credential_cache_key(self, app_id: str, team_id: str):
         return f"{app_id}:credentials:{team_id}"
@@ -183,7 +341,7 @@ class ConductorClient:
         str_result = self.redis_client.hget(key, id)
         if not str_result:
             return None
-        return json.loads(str_result)
+        return orjson.loads(str_result)
 
     def __check_balance(self, team_id, block_name):
         if not self.admin_server_url:
@@ -192,11 +350,11 @@ class ConductorClient:
         url = urljoin(self.admin_server_url, '/api/payment/check-balance')
         data = {}
         try:
-            r = requests.post(url, json={
+            r = self._http.post(url, json={
                 'teamId': team_id,
                 'blockName': block_name
             })
-            data = r.json()
+            data = orjson.loads(r.content)
         except Exception as e:
             return
 
@@ -210,103 +368,232 @@ class ConductorClient:
         ))
         asyncio.run(queue.add("event", message))
 
-    def start_polling(self):
-
-        def callback_wrapper(block_name, task, callback):
-            def wrapper():
-                workflow_instance_id = task.get('workflowInstanceId')
-                task_id = task.get('taskId')
-                externalInputPayloadStoragePath = task.get('externalInputPayloadStoragePath')
-                try:
-                    if externalInputPayloadStoragePath:
-                        tmp_file_name = os.path.join(self.external_storage_tmp_folder, f"{task_id}.json")
-                        self.external_storage.download_file_tos(tmp_file_name, externalInputPayloadStoragePath)
-                        input_data = {}
-                        with open(tmp_file_name, 'r', encoding='utf-8') as f:
-                            input_data = json.load(f)
-                        task['inputData'] = input_data
-                        os.remove(tmp_file_name)
+    def __create_task_runner(self, block_name, task, callback, prefetched_workflow_context=None):
+        """
+        prefetched_workflow_context 为批量预取到的 context 原始字节，在 task 自己的线程中反序列化
+        """
+        def wrapper():
+            workflow_instance_id = task.get('workflowInstanceId')
+            task_id = task.get('taskId')
+            externalInputPayloadStoragePath = task.get('externalInputPayloadStoragePath')
+            try:
+                if externalInputPayloadStoragePath:
+                    tmp_file_name = os.path.join(self.external_storage_tmp_folder, f"{task_id}.json")
+                    self.external_storage.download_file_tos(tmp_file_name, externalInputPayloadStoragePath)
+                    input_data = {}
+                    with open(tmp_file_name, 'rb') as f:
+                        payload = f.read()
+                    if externalInputPayloadStoragePath.endswith('.gz'):
+                        payload = gzip.decompress(payload)
+                    input_data = orjson.loads(payload)
+                    task['inputData'] = input_data
+                    os.remove(tmp_file_name)
+                if prefetched_workflow_context is not None:
+                    workflow_context = orjson.loads(prefetched_workflow_context)
+                else:
                     workflow_context = self.__get_workflow_context(workflow_instance_id)
-                    input_data = task['inputData']
-                    credential = input_data.get("credential", None)
-                    credential_data = None
-                    if credential:
-                        credential_id = credential.get('id')
-                        credential_data = self.__get_credential_data(workflow_context, credential_id)
-
-                    # 执行计费逻辑
-                    team_id = workflow_context['teamId']
-                    app_id = workflow_context['APP_ID']
-                    self.__check_balance(team_id, block_name)
-                    start = time.time()
-                    result = callback(task, workflow_context, credential_data)
-                    # 如果有明确返回值，说明是同步执行逻辑，否则是一个异步函数，由开发者自己来修改 task 状态
-                    if result:
-                        # 扣除相应的费用
-                        end = time.time()
-                        if self.admin_server_url:
-                            self.__send_task_usage_message(app_id, {
-                                "version": "1",
-                                "dataContentType": "text/json",
-                                "timestamp": int(time.time()),
-                                "origin": self.worker_id,
-                                "data": {
-                                    "workflowId": task.get('workflowType'),
-                                    "workflowInstanceId": task.get('workflowInstanceId'),
-                                    "workflowContext": workflow_context,
-                                    "blockName": block_name,
-                                    "taskReferenceName": task.get('referenceTaskName'),
-                                    "taskId": task.get('taskId'),
-                                    "executeTime": end - start
-                                }
-                            })
-
-                        self.update_task_result(
-                            workflow_instance_id=workflow_instance_id,
-                            task_id=task_id,
-                            status="COMPLETED",
-                            output_data=result
-                        )
-                        del self.tasks[task_id]
-                except Exception as e:
-                    traceback.print_exc()
+                input_data = task['inputData']
+                credential = input_data.get("credential", None)
+                credential_data = None
+                if credential:
+                    credential_id = credential.get('id')
+                    credential_data = self.__get_credential_data(workflow_context, credential_id)
+
+                # 执行计费逻辑
+                team_id = workflow_context['teamId']
+                app_id = workflow_context['APP_ID']
+                self.__check_balance(team_id, block_name)
+                start = time.time()
+                result = callback(task, workflow_context, credential_data)
+                # 如果有明确返回值，说明是同步执行逻辑，否则是一个异步函数，由开发者自己来修改 task 状态
+                if result:
+                    # 扣除相应的费用
+                    end = time.time()
+                    if self.admin_server_url:
+                        self.__send_task_usage_message(app_id, {
+                            "version": "1",
+                            "dataContentType": "text/json",
+                            "timestamp": int(time.time()),
+                            "origin": self.worker_id,
+                            "data": {
+                                "workflowId": task.get('workflowType'),
+                                "workflowInstanceId": task.get('workflowInstanceId'),
+                                "workflowContext": workflow_context,
+                                "blockName": block_name,
+                                "taskReferenceName": task.get('referenceTaskName'),
+                                "taskId": task.get('taskId'),
+                                "executeTime": end - start
+                            }
+                        })
+
                     self.update_task_result(
                         workflow_instance_id=workflow_instance_id,
                         task_id=task_id,
-                        status="FAILED",
-                        output_data={
-                            "success": False,
-                            "errMsg": str(e)
-                        }
+                        status="COMPLETED",
+                        output_data=result
                     )
-                    del self.tasks[task_id]
+                    self.__remove_task(task_id)
+            except Exception as e:
+                logger.exception("task %s 执行失败，workflowInstanceId=%s", task_id, workflow_instance_id)
+                self.update_task_result(
+                    workflow_instance_id=workflow_instance_id,
+                    task_id=task_id,
+                    status="FAILED",
+                    output_data={
+                        "success": False,
+                        "errMsg": str(e)
+                    }
+                )
+                self.__remove_task(task_id)
 
-            return wrapper
+        return wrapper
 
-        logging.info(f"开始从 conductor 轮询拉取任务：{self.task_types.keys()}")
+    async def __poll_loop(self, task_type, handler):
+        """
+        持续轮询某一种 task，每种 task 拥有独立的轮询节奏，互不阻塞
+        """
+        callback = handler['callback']
+        block_name = handler['block_name']
+        # 轮询循环会一直运行，把循环内用到的属性和方法预先绑定到局部变量上，减少属性查找
+        worker_id = self.worker_id
+        batch_poll_count = self.batch_poll_count
+        min_sleep_ms = self.poll_interval_ms
+        max_sleep_ms = self.max_poll_interval_ms
+        get_poll_backoff_ms = self.__get_poll_backoff_ms
+        running_tasks = self.tasks
+        task_futures = self.task_futures
+        tasks_lock = self._tasks_lock
+        poll = self.__poll_by_task_type
+        get_workflow_contexts = self.__get_workflow_contexts
+        create_task_runner = self.__create_task_runner
+        remove_task_future = self.__remove_task_future
+        reserve_slots = self.__reserve_slots
+        release_slots = self.__release_slots
+        submit = self._executor.submit
+        # 连续拉取为空（或失败）的次数，用于计算退避时间
+        empty_count = 0
         while True:
-            for task_type in self.task_types:
-                try:
-                    tasks = self.__poll_by_task_type(task_type, self.worker_id, 1)
-                    if len(tasks) > 0:
-                        logging.info(f"拉取到 {len(tasks)} 条 {task_type} 任务")
-                    for task in tasks:
-                        callback = self.task_types[task_type]['callback']
-                        block_name = self.task_types[task_type]['block_name']
-                        task_id = task.get('taskId')
-                        self.tasks[task_id] = task
-                        t = threading.Thread(
-                            target=callback_wrapper(block_name, task, callback)
+            # 拉取前先预占线程池空位，线程池已满时暂停拉取，避免任务在本地堆积
+            reserved = reserve_slots(batch_poll_count)
+            if reserved <= 0:
+                await asyncio.sleep(min_sleep_ms / 1000)
+                continue
+            try:
+                # 一次请求批量拉取多条任务，每条任务都独立并发执行
+                tasks = await poll(task_type, worker_id, reserved)
+                if len(tasks) > 0:
+                    empty_count = 0
+                    logger.info("拉取到 %s 条 %s 任务", len(tasks), task_type)
+                else:
+                    # 计数封顶，避免长时间空闲后计算退避时间时溢出
+                    empty_count = min(empty_count + 1, MAX_EMPTY_POLL_COUNT)
+                workflow_contexts = {}
+                if tasks:
+                    # 整批任务的 workflow context 通过 redis 一次性取回，未取到的由各 task 自行获取
+                    try:
+                        workflow_contexts = await asyncio.to_thread(
+                            get_workflow_contexts, [task.get('workflowInstanceId') for task in tasks]
                         )
-                        t.start()
+                    except Exception:
+                        logger.exception("批量获取 %s 任务的 workflow context 失败", task_type)
+                for task in tasks:
+                    task_id = task.get('taskId')
+                    with tasks_lock:
+                        running_tasks[task_id] = task
+                        # callback 是阻塞的用户代码，放到线程池中执行，避免阻塞事件循环
+                        future = submit(create_task_runner(
+                            block_name, task, callback, workflow_contexts.get(task.get('workflowInstanceId'))
+                        ))
+                        task_futures[task_id] = future
+                        # 已提交的 task 由 task_futures 计数，对应的预占位同时归还
+                        self._reserved_slots -= 1
+                        reserved -= 1
+                    future.add_done_callback(lambda _, task_id=task_id: remove_task_future(task_id))
+            except Exception:
+                empty_count = min(empty_count + 1, MAX_EMPTY_POLL_COUNT)
+                logger.exception("从 conductor 拉取 %s 任务失败", task_type)
+            finally:
+                # 归还未用到的预占位（拉取到的任务少于预占数，或拉取失败）
+                release_slots(reserved)
+            # 拉取到任务后立即进行下一次长轮询，只有在队列为空或请求失败时才退避
+            # 退避时间加入随机抖动，避免多个 worker 副本同时请求 conductor
+            if empty_count > 0:
+                # 退避时间的计算不能让异常逃出轮询循环，否则 gather 会让整个 worker 退出
+                try:
+                    sleep_ms = get_poll_backoff_ms(empty_count)
                 except Exception:
-                    traceback.print_exc()
-                time.sleep(self.poll_interval_ms / 1000)
+                    logger.exception("计算 %s 任务的退避时间失败", task_type)
+                    sleep_ms = max_sleep_ms
+                await asyncio.sleep(sleep_ms / 1000)
+
+    def __get_poll_backoff_ms(self, empty_count):
+        """
+        在 [poll_interval_ms, min(max_poll_interval_ms, poll_interval_ms * rate ** empty_count)] 内随机取退避时间
+        """
+        min_sleep_ms = self.poll_interval_ms
+        max_sleep_ms = self.max_poll_interval_ms
+        try:
+            upper_ms = min(max_sleep_ms, min_sleep_ms * self.poll_backoff_rate ** empty_count)
+        except OverflowError:
+            upper_ms = max_sleep_ms
+        return random.uniform(min_sleep_ms, max(min_sleep_ms, upper_ms))
+
+    async def start(self):
+        """
+        在当前事件循环中从 conductor 轮询拉取任务，所有轮询请求共享同一个 aiohttp 连接池
+        """
+        auth = self._auth
+        self._session = aiohttp.ClientSession(
+            auth=aiohttp.BasicAuth(auth.username, auth.password) if auth else None,
+            connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=75)
+        )
+        logger.info("redis 客户端使用 %s 协议解析器", 'hiredis' if HIREDIS_AVAILABLE else '纯 Python')
+        with self._task_types_lock:
+            task_types = list(self.task_types.items())
+        logger.info("开始从 conductor 轮询拉取任务：%s", [task_type for task_type, _ in task_types])
+        try:
+            await asyncio.gather(
+                *(self.__poll_loop(task_type, handler) for task_type, handler in task_types)
+            )
+        finally:
+            await self._session.close()
+
+    def start_polling(self):
+        asyncio.run(self.start())
+
+    def __remove_task(self, task_id):
+        with self._tasks_lock:
+            self.tasks.pop(task_id, None)
+
+    def __remove_task_future(self, task_id):
+        with self._tasks_lock:
+            self.task_futures.pop(task_id, None)
+
+    def __reserve_slots(self, count):
+        """
+        预占最多 count 个线程池空位，返回实际预占的数量
+        """
+        with self._tasks_lock:
+            free_slots = self.max_workers - len(self.task_futures) - self._reserved_slots
+            reserved = max(0, min(count, free_slots))
+            self._reserved_slots += reserved
+            return reserved
+
+    def __release_slots(self, count):
+        with self._tasks_lock:
+            self._reserved_slots -= count
 
     def set_all_tasks_to_failed_state(self):
-        running_task_ids = self.tasks.keys()
-        for task_id in running_task_ids:
-            task = self.tasks[task_id]
+        # 整个退出流程（入队与等待提交）最多耗时 shutdown_timeout_seconds，避免超出进程退出的宽限时间
+        self._shutdown_deadline = time.monotonic() + self.shutdown_timeout_seconds
+        # 先在锁内拷贝快照，再在锁外逐个更新状态，避免遍历过程中 dict 被其他线程修改
+        with self._tasks_lock:
+            futures = list(self.task_futures.values())
+            running_tasks = list(self.tasks.items())
+        # 还在线程池队列中排队的 task 不再执行
+        for future in futures:
+            future.cancel()
+        for task_id, task in running_tasks:
             workflow_instance_id = task.get('workflowInstanceId')
             self.update_task_result(
                 workflow_instance_id=workflow_instance_id,
@@ -317,6 +604,66 @@ class ConductorClient:
                     "errMsg": "worker 已重启，请重新运行"
                 }
             )
+        # 等待所有 task 结果提交完成，超时则放弃
+        with self._update_q.all_tasks_done:
+            drained = self._update_q.all_tasks_done.wait_for(
+                lambda: not self._update_q.unfinished_tasks,
+                timeout=max(0.0, self._shutdown_deadline - time.monotonic())
+            )
+        if not drained:
+            logger.error("等待 task 结果提交超时，仍有 %s 条结果未提交", self._update_q.unfinished_tasks)
+
+    def __submit_task_results(self):
+        while True:
+            task_id, payload = self._update_q.get()
+            try:
+                self.__post_task_result(task_id, payload)
+            finally:
+                self._update_q.task_done()
+
+    def __post_task_result(self, task_id, payload):
+        """
+        提交 task 结果，请求失败或返回 5xx/429 时重试。session 的 Retry 不会重试 POST，因此在这里显式重试
+        """
+        for attempt in range(1, self.task_update_max_retries + 1):
+            try:
+                r = self._http.post(
+                    self._tasks_url,
+                    data=payload,
+                    headers={'Content-Type': 'application/json'},
+                    auth=self._auth,
+                    timeout=self.task_update_timeout_seconds
+                )
+            except Exception:
+                logger.exception("向 conductor 提交 task %s 结果失败（第 %s 次）", task_id, attempt)
+            else:
+                if r.ok:
+                    return
+                logger.error("向 conductor 提交 task %s 结果失败（第 %s 次）：status=%s, body=%s",
+                             task_id, attempt, r.status_code, r.text)
+                # 其他 4xx 说明请求本身有问题，重试也不会成功
+                if r.status_code < 500 and r.status_code != 429:
+                    return
+            if attempt < self.task_update_max_retries:
+                time.sleep(0.5 * 2 ** (attempt - 1))
+        logger.error("向 conductor 提交 task %s 结果失败，已重试 %s 次，放弃提交", task_id, self.task_update_max_retries)
+
+    def __is_small_output(self, output_data):
+        """
+        不序列化 output，只根据顶层的值估算序列化后大小的上限，判断是否一定小于临界值。
+        存在嵌套结构时无法估算，返回 False
+        """
+        if not isinstance(output_data, dict):
+            return False
+        # 每个字符序列化后最多占 6 个字节（\uXXXX 转义）
+        estimated_size = 2
+        for key, value in output_data.items():
+            estimated_size += len(str(key)) * 6 + 32
+            if isinstance(value, str):
+                estimated_size += len(value) * 6
+            elif value is not None and not isinstance(value, (bool, int, float)):
+                return False
+        return estimated_size <= self.task_output_payload_size_threshold_kb * 1024
 
     def update_task_result(self, workflow_instance_id, task_id, status,
                            output_data=None,
@@ -333,35 +680,51 @@ class ConductorClient:
             "status": status,
             "workerId": self.worker_id
         }
-        if output_data:
-            obj_bytes = json.dumps(output_data).encode('utf-8')
+        # 已序列化好的 outputData，提交时直接复用，避免重复序列化
+        output_bytes = None
+        if output_data and self.__is_small_output(output_data):
+            body['outputData'] = output_data
+        elif output_data:
+            # orjson 直接输出 bytes，无需再 encode
+            obj_bytes = orjson.dumps(output_data, option=orjson.OPT_NON_STR_KEYS)
             size = len(obj_bytes)
             size_in_kb = size / 1024
             # 大于临界值，需要上传
             if size_in_kb > self.task_output_payload_size_threshold_kb:
                 key = f"task/output/{task_id}.json"
+                extra_args = {'ContentType': 'application/json'}
                 start = time.time()
                 print(
                     f"检测到 {task_id} 的 output ({size_in_kb} kb) 大于临界值 {self.task_output_payload_size_threshold_kb} kb，开始上传到 oss 外部存储")
-                self.external_storage.upload_bytes(
-                    key,
-                    obj_bytes
-                )
+                # JSON 压缩率很高，level 1 的压缩耗时远小于节省下来的上传时间；以 .gz 后缀标记，读取方需要解压。
+                # 不设置 ContentEncoding，否则 HTTP 客户端会自动解压，按后缀再解压一次就会失败
+                if size >= 16 * 1024:
+                    obj_bytes = gzip.compress(obj_bytes, compresslevel=1)
+                    key = f"{key}.gz"
+                    extra_args['ContentType'] = 'application/gzip'
+                self.external_storage.upload_fileobj(key, io.BytesIO(obj_bytes), extra_args)
                 end = time.time()
                 spend = end - start
                 print(f"上传到 oss 外部存储成功：path={key}, 耗时={spend} s")
                 body['outputData'] = {}
                 body['externalOutputPayloadStoragePath'] = key
             else:
-                body['outputData'] = output_data
+                output_bytes = obj_bytes
         if reason_for_incompletion:
             body['reasonForIncompletion'] = reason_for_incompletion
         if callback_after_seconds:
             body['callbackAfterSeconds'] = callback_after_seconds
         if worker_id:
             body['workerId'] = worker_id
-        requests.post(
-            f"{self.conductor_base_url}/tasks",
-            json=body,
-            auth=self.__get_auth()
-        )
+        payload = orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS)
+        if output_bytes is not None:
+            # body 至少包含 taskId 等字段，可以直接把 outputData 拼接到 JSON 对象末尾
+            payload = payload[:-1] + b',"outputData":' + output_bytes + b'}'
+        deadline = self._shutdown_deadline
+        if deadline is None:
+            self._update_q.put((task_id, payload))
+            return
+        try:
+            self._update_q.put((task_id, payload), timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Full:
+            logger.error("worker 正在退出，task %s 结果未能提交", task_id)
@@ -95,6 +95,15 @@ class OSSClient():
             Body=bytes
         )
 
+    def upload_fileobj(self, key, fileobj, extra_args=None):
+        """ 以流的方式上传文件对象，较大的文件会自动分片上传 """
+        self.client.upload_fileobj(
+            fileobj,
+            self.bucket_name,
+            key,
+            ExtraArgs=extra_args
+        )
+
     def __get_file_extension(self, file_path):
         _, file_extension = os.path.splitext(file_path)
         return file_extension